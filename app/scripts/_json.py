@@ -0,0 +1,52 @@
+"""
+JSON rápido: orjson quando instalado, json da stdlib caso contrário.
+Também lê/escreve JSONL (um objeto por linha), opcionalmente em gzip.
+dumps() sempre retorna bytes UTF-8 (como o orjson).
+"""
+import gzip
+import json
+
+try:
+    import orjson
+    _HAVE_ORJSON = True
+except Exception:
+    _HAVE_ORJSON = False
+
+def dumps(obj, indent=False):
+    if _HAVE_ORJSON:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option)
+    return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False).encode("utf-8")
+
+def loads(data):
+    if _HAVE_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dump(obj, path, indent=False):
+    with open(path, "wb") as f:
+        f.write(dumps(obj, indent=indent))
+
+def load(path):
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+def open_jsonl(path, mode="rb"):
+    """Abre um arquivo JSONL; '.gz' usa gzip com compressão baixa (nível 3) na escrita."""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, compresslevel=3)
+    return open(path, mode)
+
+def is_jsonl(path):
+    return path.endswith((".jsonl", ".jsonl.gz"))
+
+def write_jsonl_line(f, obj):
+    f.write(dumps(obj) + b"\n")
+
+def iter_jsonl(path):
+    with open_jsonl(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield loads(line)
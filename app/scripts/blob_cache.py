@@ -0,0 +1,82 @@
+"""
+Cache persistente (SQLite) de blobs e trees do GitHub, indexado por SHA.
+Conteúdo endereçado por hash nunca muda, então as entradas não expiram.
+"""
+import json
+import os
+import sqlite3
+import threading
+import zlib
+
+DEFAULT_CACHE_DIR = os.path.join("app", "results", "cache")
+CACHE_FILE = "blobs.sqlite3"
+
+class BlobCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, CACHE_FILE)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS blobs (sha TEXT PRIMARY KEY, zbody BLOB)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS trees (sha TEXT PRIMARY KEY, zbody BLOB)")
+
+    def _get(self, table, sha):
+        with self._lock:
+            row = self._conn.execute(f"SELECT zbody FROM {table} WHERE sha = ?", (sha,)).fetchone()
+        if row is None:
+            return None
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def _put(self, table, sha, text):
+        zbody = zlib.compress(text.encode("utf-8", errors="replace"))
+        with self._lock:
+            self._conn.execute(f"INSERT OR REPLACE INTO {table} (sha, zbody) VALUES (?, ?)", (sha, zbody))
+
+    def get_blob(self, sha):
+        return self._get("blobs", sha)
+
+    def put_blob(self, sha, text):
+        self._put("blobs", sha, text)
+
+    def get_tree(self, sha):
+        body = self._get("trees", sha)
+        return json.loads(body) if body is not None else None
+
+    def put_tree(self, sha, items):
+        self._put("trees", sha, json.dumps(items))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_cache_dir = DEFAULT_CACHE_DIR
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+def configure(cache_dir):
+    """Define o diretório do cache; vazio/None desativa."""
+    global _cache_dir, _cache
+    with _cache_lock:
+        if _cache is not None and _cache_pid == os.getpid():
+            _cache.close()
+        _cache_dir = cache_dir
+        _cache = None
+
+def get_cache():
+    global _cache, _cache_dir, _cache_pid
+    if not _cache_dir:
+        return None
+    with _cache_lock:
+        # conexões sqlite não sobrevivem a fork: cada processo abre a sua
+        if _cache is None or _cache_pid != os.getpid():
+            try:
+                _cache = BlobCache(_cache_dir)
+                _cache_pid = os.getpid()
+            except sqlite3.Error as e:
+                print(f"[cache] warning: cache desativado ({e})", flush=True)
+                _cache_dir = None
+                _cache = None
+        return _cache
@@ -7,16 +7,22 @@ Modificações:
 - prints de progresso para debug (mostra quantos blobs foram encontrados e progresso)
 """
 import argparse
-import json
+import multiprocessing
 import os
 import shutil
-import tempfile
 import re
+import sys
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta
-from statistics import mean
-from app.scripts.github_api import list_commits_touching_path, get_commit_detail, get_tree_for_ref, get_blob_content, make_session, fetch_package_json_at_ref
-from app.scripts.metrics import get_cve_for_package, load_osv_cache, save_osv_cache
+from itertools import islice
+from app.scripts.github_api import list_commits_touching_path, get_commit_detail, get_tree_for_ref, get_blob_content, iter_blob_contents, make_session, fetch_package_json_at_ref, get_rate_limit, HTTP_POOL_SIZE, graphql_iter_js_blobs_for_commit, graphql_fetch_trees
+from app.scripts import _json, blob_cache
+from app.scripts.compute_js_metrics import count_loc, fast_cc
+from app.scripts.metrics import get_cve_for_package, load_osv_cache
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -27,10 +33,39 @@ try:
 except Exception:
     _HAVE_LIZARD = False
 
+# análise em memória; sem analyze_source_code o lizard é ignorado (sem arquivos temporários)
+_ANALYZE = getattr(getattr(lizard, "analyze_file", None), "analyze_source_code", None) if _HAVE_LIZARD else None
+if _HAVE_LIZARD and _ANALYZE is None:
+    print("[lizard] warning: lizard.analyze_file.analyze_source_code indisponível; usando fast_cc", flush=True)
+    _HAVE_LIZARD = False
+
+# memo das complexidades por (extensão, hash do fonte): arquivos vendorizados se repetem entre commits
+LIZARD_MEMO_MAX = 2048
+_lizard_memo = OrderedDict()
+_lizard_memo_lock = threading.Lock()
+
+# lizard só com --accurate (ou FAST_CC=0); por padrão usa a contagem de palavras-chave (fast_cc)
+ACCURATE_CC = os.getenv("FAST_CC", "1") == "0"
+
+def set_accurate_cc(flag):
+    global ACCURATE_CC
+    ACCURATE_CC = bool(flag)
+
 SRC_EXTS = (".js", ".jsx", ".ts", ".tsx", ".mjs", ".cjs")
 SKIP_PATH_PARTS = ("node_modules/", "bower_components/", "dist/", "build/", "vendor/", ".git/")
+SKIP_PATH_SUFFIXES = (".min.js", ".bundle.js", ".min.css", "-lock.json")
 MAX_BLOB_BYTES = 1024 * 1024  # 1 MB
-_pkg_line_re = re.compile(r'^[\-\+]\s*"(?P<name>[^"]+)":\s*"(?P<ver>[^"]+)"', flags=re.MULTILINE)
+# heurística de minificado: linha > 2000 chars ou média > 500 chars/linha
+MINIFIED_MAX_LINE = 2000
+MINIFIED_AVG_LINE = 500
+BLOB_FETCH_WORKERS = 16
+# análise de complexidade em processos (CPU-bound, GIL); CC_WORKERS=1 roda na thread atual
+CC_WORKERS = int(os.getenv("CC_WORKERS") or os.cpu_count() or 1)
+_cc_pool = None
+_cc_pool_lock = threading.Lock()
+# sem fork: um fork feito enquanto outras threads seguram locks (HTTP, SQLite, stdout) pode herdá-los travados
+_CC_MP_CONTEXT = multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+_pkg_line_re = re.compile(r'^(?P<op>[-+])\s*"(?P<name>[^"]+)":\s*"(?P<ver>[^"]+)"', flags=re.MULTILINE)
 
 def parse_removed_added_from_patch(patch_text):
     removed = {}
@@ -38,8 +73,7 @@ def parse_removed_added_from_patch(patch_text):
     if not patch_text:
         return removed, added
     for m in _pkg_line_re.finditer(patch_text):
-        line = m.group(0)
-        op = line[0]
+        op = m.group('op')
         name = m.group('name')
         ver = m.group('ver')
         if op == '-':
@@ -49,29 +83,19 @@ def parse_removed_added_from_patch(patch_text):
     return removed, added
 
 def analyze_source_complexity(source_code, filename_for_reporting="<blob>"):
-    lines = [ln for ln in source_code.splitlines() if ln.strip()]
-    loc = len(lines)
+    if not (_HAVE_LIZARD and ACCURATE_CC):
+        return fast_cc(source_code)
+    loc = count_loc(source_code)
     complexities = []
-    if not _HAVE_LIZARD:
-        return loc, complexities
+    key = (os.path.splitext(filename_for_reporting)[1], hash(source_code), len(source_code))
+    with _lizard_memo_lock:
+        memo = _lizard_memo.get(key)
+        if memo is not None:
+            _lizard_memo.move_to_end(key)
+            return loc, list(memo)
     try:
-        if hasattr(lizard.analyze_file, "analyze_source_code"):
-            analysis = lizard.analyze_file.analyze_source_code(filename_for_reporting, source_code)
-            funcs = getattr(analysis, "function_list", []) or []
-        else:
-            tf = None
-            try:
-                tf = tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(filename_for_reporting)[1] or ".js")
-                tf.write(source_code.encode("utf-8", errors="replace"))
-                tf.close()
-                analysis = lizard.analyze_file.analyze_file(tf.name)
-                funcs = getattr(analysis, "function_list", []) or []
-            finally:
-                if tf:
-                    try:
-                        os.unlink(tf.name)
-                    except Exception:
-                        pass
+        analysis = _ANALYZE(filename_for_reporting, source_code)
+        funcs = getattr(analysis, "function_list", []) or []
         for f in funcs:
             c = None
             for attr in ("cyclomatic_complexity", "complexity", "cyclomatic"):
@@ -86,15 +110,141 @@ def analyze_source_complexity(source_code, filename_for_reporting="<blob>"):
     except Exception as e:
         print(f"[lizard] warning: failed to analyze {filename_for_reporting} with lizard: {e}")
         return loc, []
+    with _lizard_memo_lock:
+        _lizard_memo[key] = tuple(complexities)
+        while len(_lizard_memo) > LIZARD_MEMO_MAX:
+            _lizard_memo.popitem(last=False)
     return loc, complexities
 
-def compute_metrics_from_commit(repo_full_name, commit_sha, session=None, file_limit=200):
-    session = session or make_session()
-    tree_items = get_tree_for_ref(repo_full_name, ref=commit_sha, session=session)
-    if not tree_items:
-        return {"lines_of_code": 0, "avg_complexity": 0.0, "files_processed": 0}
-    # filter candidate blobs
-    candidates = []
+def _get_cc_pool():
+    global _cc_pool
+    if CC_WORKERS <= 1:
+        return None
+    with _cc_pool_lock:
+        if _cc_pool is None:
+            # initializer repassa --accurate para workers criados via forkserver/spawn
+            _cc_pool = ProcessPoolExecutor(max_workers=CC_WORKERS, mp_context=_CC_MP_CONTEXT, initializer=set_accurate_cc, initargs=(ACCURATE_CC,))
+        return _cc_pool
+
+def start_cc_pool():
+    """Cria o pool de complexidade na thread principal, antes das threads de mineração."""
+    return _get_cc_pool()
+
+def _discard_cc_pool(pool):
+    global _cc_pool
+    if pool is None:
+        return False
+    with _cc_pool_lock:
+        if _cc_pool is not pool:
+            return False  # já descartado/recriado por outra thread
+        _cc_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+    return True
+
+def _is_binary(content):
+    return '\x00' in content[:2048]
+
+def _is_minified(content, newlines):
+    if newlines and len(content) / newlines > MINIFIED_AVG_LINE:
+        return True
+    # varredura linear pelos '\n' (uma regex [^\n]{N} retrocede e fica quadrática em linhas longas)
+    pos = 0
+    find = content.find
+    while True:
+        nxt = find('\n', pos)
+        if nxt < 0:
+            return len(content) - pos > MINIFIED_MAX_LINE
+        if nxt - pos > MINIFIED_MAX_LINE:
+            return True
+        pos = nxt + 1
+
+# métricas por blob SHA: entre parent e commit quase todos os blobs são iguais,
+# então o segundo compute_metrics_from_commit só busca/analisa os que mudaram
+BLOB_METRICS_MEMO_MAX = 20000
+_SKIPPED = object()  # blob binário: não entra nas métricas
+_blob_metrics_memo = OrderedDict()
+_blob_metrics_lock = threading.Lock()
+
+def _blob_metrics_get(blob_sha):
+    with _blob_metrics_lock:
+        entry = _blob_metrics_memo.get(blob_sha)
+        if entry is not None:
+            _blob_metrics_memo.move_to_end(blob_sha)
+        return entry
+
+def _blob_metrics_put(blob_sha, entry):
+    if not blob_sha:
+        return
+    with _blob_metrics_lock:
+        _blob_metrics_memo[blob_sha] = entry
+        _blob_metrics_memo.move_to_end(blob_sha)
+        while len(_blob_metrics_memo) > BLOB_METRICS_MEMO_MAX:
+            _blob_metrics_memo.popitem(last=False)
+
+def _iter_blob_texts(repo_full_name, commit_sha, candidates, session):
+    """
+    Gera (item, content) dos blobs candidatos em ordem de chegada; GraphQL quando há token, REST caso contrário.
+    Cada caminho busca aos poucos (bloco GraphQL / janela de downloads): só alguns textos em memória por vez.
+    """
+    cache = blob_cache.get_cache()
+
+    def _store(item, text):
+        if cache is not None and text is not None:
+            cache.put_blob(item.get("sha"), text)
+
+    if session.headers.get("Authorization"):
+        missing = []
+        for item in candidates:
+            text = cache.get_blob(item.get("sha")) if cache is not None else None
+            if text is not None:
+                yield item, text
+            else:
+                missing.append(item)
+        by_path = {item.get("path"): item for item in missing}
+        for texts in (graphql_iter_js_blobs_for_commit(repo_full_name, commit_sha, list(by_path), session=session) if missing else ()):
+            if texts is None:
+                break
+            for path, text in texts.items():
+                item = by_path.pop(path)
+                _store(item, text)
+                yield item, text
+        if not by_path:
+            return
+        # GraphQL falhou no meio: o restante vai pelo REST
+        candidates = list(by_path.values())
+    # se a cota restante não cobre o commit, baixa um blob por vez (vale para httpx e threads)
+    remaining, _ = get_rate_limit("core")
+    quota_ok = remaining is None or remaining > len(candidates)
+    # com httpx: AsyncClient (HTTP/2 multiplexado), resultados em ordem de chegada
+    by_sha = {}
+    for item in candidates:
+        by_sha.setdefault(item.get("sha"), []).append(item)
+    texts = iter_blob_contents(repo_full_name, list(by_sha), session=session, concurrency=HTTP_POOL_SIZE if quota_ok else 1)
+    if texts is not None:
+        for sha, text in texts:
+            for item in by_sha[sha]:
+                yield item, text
+        return
+    # blobs baixados em paralelo
+    workers = BLOB_FETCH_WORKERS if quota_ok else 1
+    items = iter(candidates)
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        # janela de downloads em voo: cada texto é entregue (e liberado) assim que chega
+        for item in islice(items, workers * 2):
+            pending[ex.submit(get_blob_content, repo_full_name, item.get("sha"), session)] = item
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                item = pending.pop(fut)
+                nxt = next(items, None)
+                if nxt is not None:
+                    pending[ex.submit(get_blob_content, repo_full_name, nxt.get("sha"), session)] = nxt
+                # lizard não é thread-safe: quem consome (analyze_source_complexity) fica na thread principal
+                yield item, fut.result()
+
+def _iter_candidates(tree_items):
+    """Blobs JS/TS do tree que entram nas métricas."""
     for item in tree_items:
         if item.get("type") != "blob":
             continue
@@ -103,38 +253,90 @@ def compute_metrics_from_commit(repo_full_name, commit_sha, session=None, file_l
             continue
         if any(p in path for p in SKIP_PATH_PARTS):
             continue
+        if path.lower().endswith(SKIP_PATH_SUFFIXES):
+            continue
         size = item.get("size") or 0
         if size and size > MAX_BLOB_BYTES:
             continue
-        candidates.append(item)
-    total_candidates = len(candidates)
-    if total_candidates == 0:
-        return {"lines_of_code": 0, "avg_complexity": 0.0, "files_processed": 0}
-    # limit
-    if file_limit and total_candidates > file_limit:
-        candidates = candidates[:file_limit]
-        total_to_process = file_limit
-    else:
-        total_to_process = total_candidates
-    # print(f"[metrics] {repo_full_name}@{commit_sha} -> {total_candidates} candidate blobs, processing {total_to_process}", flush=True)
-    total_loc = 0
-    complexity_vals = []
-    processed_files = 0
-    report_every = max(1, total_to_process // 10)
-    for idx, item in enumerate(candidates, start=1):
-        blob_sha = item.get("sha")
-        path = item.get("path")
-        content = get_blob_content(repo_full_name, blob_sha, session=session)
+        yield item
+
+def _iter_blob_metrics(repo_full_name, commit_sha, candidates, session):
+    """Gera (loc, complexities) por arquivo: memo por SHA, depois blobs baixados e analisados."""
+    to_fetch = []
+    for item in candidates:
+        entry = _blob_metrics_get(item.get("sha"))
+        if entry is None:
+            to_fetch.append(item)
+        elif entry is not _SKIPPED:
+            yield entry
+    pool = _get_cc_pool()
+    pending = {}
+    for item, content in _iter_blob_texts(repo_full_name, commit_sha, to_fetch, session):
         if content is None:
             # could be binary or API issue; skip
             continue
-        loc, comps = analyze_source_complexity(content, filename_for_reporting=path)
+        if _is_binary(content):
+            _blob_metrics_put(item.get("sha"), _SKIPPED)
+            continue
+        nl = content.count('\n')
+        if _is_minified(content, nl):
+            # CC de código minificado não significa nada: só conta as linhas
+            entry = (nl or 1, ())
+        elif pool is not None:
+            # fonte fica retido na fila do pool até ser analisado: limita os envios em voo
+            if len(pending) >= CC_WORKERS * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    yield _cc_result(fut, *pending.pop(fut))
+            try:
+                pending[pool.submit(analyze_source_complexity, content, item.get("path"))] = (item, content, pool)
+                continue
+            except BrokenProcessPool:
+                _discard_cc_pool(pool)
+                pool = _get_cc_pool()
+                loc, comps = analyze_source_complexity(content, filename_for_reporting=item.get("path"))
+                entry = (loc, tuple(comps))
+        else:
+            loc, comps = analyze_source_complexity(content, filename_for_reporting=item.get("path"))
+            entry = (loc, tuple(comps))
+        _blob_metrics_put(item.get("sha"), entry)
+        yield entry
+    for fut in as_completed(pending):
+        yield _cc_result(fut, *pending[fut])
+
+def _cc_result(fut, item, content, pool):
+    try:
+        loc, comps = fut.result()
+    except BrokenProcessPool as e:
+        # um worker morreu: o pool inteiro fica inutilizável; recria para os próximos e analisa este aqui
+        if _discard_cc_pool(pool):
+            print(f"[cc] warning: process pool quebrado ({e}); recriando", flush=True)
+        loc, comps = analyze_source_complexity(content, filename_for_reporting=item.get("path"))
+    entry = (loc, tuple(comps))
+    _blob_metrics_put(item.get("sha"), entry)
+    return entry
+
+def compute_metrics_from_commit(repo_full_name, commit_sha, session=None, file_limit=200, tree_items=None):
+    session = session or make_session()
+    if tree_items is None:
+        tree_items = get_tree_for_ref(repo_full_name, ref=commit_sha, session=session)
+    if not tree_items:
+        return {"lines_of_code": 0, "avg_complexity": 0.0, "files_processed": 0}
+    candidates = list(islice(_iter_candidates(tree_items), file_limit or None))
+    if not candidates:
+        return {"lines_of_code": 0, "avg_complexity": 0.0, "files_processed": 0}
+    # print(f"[metrics] {repo_full_name}@{commit_sha} -> processing {len(candidates)} candidate blobs", flush=True)
+    # soma/contagem corrente em vez da lista de complexidades
+    total_loc = 0
+    complexity_sum = 0.0
+    complexity_n = 0
+    processed_files = 0
+    for loc, comps in _iter_blob_metrics(repo_full_name, commit_sha, candidates, session):
         total_loc += loc
-        complexity_vals.extend(comps)
+        complexity_sum += sum(comps)
+        complexity_n += len(comps)
         processed_files += 1
-        # if idx % report_every == 0 or idx == total_to_process:
-        #     print(f"[metrics] processed {idx}/{total_to_process} files for {repo_full_name}@{commit_sha}", flush=True)
-    avg_complexity = float(mean(complexity_vals)) if complexity_vals else 0.0
+    avg_complexity = complexity_sum / complexity_n if complexity_n else 0.0
     return {"lines_of_code": total_loc, "avg_complexity": round(avg_complexity, 4), "files_processed": processed_files}
 
 def analyze_repo(full_name, token=None, limit_commits=None, include_pkg_snapshots=False, write_per_repo_file=None, max_candidates_per_repo=1, days_back=None, session=None, file_limit=200):
@@ -142,9 +344,12 @@ def analyze_repo(full_name, token=None, limit_commits=None, include_pkg_snapshot
     if token:
         session.headers.update({"Authorization": f"token {token}"})
     if days_back:
-        cutoff_dt = datetime.utcnow() - timedelta(days=int(days_back))
+        # datas da API vêm em ISO-8601 UTC com 'Z': comparação de string equivale à de datas.
+        # Atenção: a versão anterior comparava datetime aware com utcnow() naive (TypeError em todo commit,
+        # que era mantido), então --days_back não filtrava nada; agora o corte vale de fato (0 desativa).
+        cutoff_iso = (datetime.utcnow() - timedelta(days=int(days_back))).strftime("%Y-%m-%dT%H:%M:%SZ")
     else:
-        cutoff_dt = None
+        cutoff_iso = None
     commits = list_commits_touching_path(full_name, path="package.json", session=session, per_page=100)
     if not commits:
         return []
@@ -152,20 +357,13 @@ def analyze_repo(full_name, token=None, limit_commits=None, include_pkg_snapshot
         filtered = []
         for c in commits:
             date_s = (c.get("commit") or {}).get("author", {}).get("date")
-            if not date_s:
+            if not date_s or date_s >= cutoff_iso:
                 filtered.append(c)
-            else:
-                try:
-                    cd = datetime.fromisoformat(date_s.replace("Z", "+00:00"))
-                    if cd >= cutoff_dt:
-                        filtered.append(c)
-                except Exception:
-                    filtered.append(c)
         commits = filtered
     if limit_commits:
         commits = commits[:limit_commits]
     results = []
-    cache = load_osv_cache() or {}
+    cache = load_osv_cache()
     try:
         for c in commits:
             if max_candidates_per_repo and len(results) >= max_candidates_per_repo:
@@ -200,14 +398,20 @@ def analyze_repo(full_name, token=None, limit_commits=None, include_pkg_snapshot
             if not removed_list:
                 continue
             try:
+                # trees de parent/commit (e package.json, se pedido) num único POST GraphQL
+                pkg_files = sorted({r.get("file") for r in removed_list}) if include_pkg_snapshots else []
+                prefetched = None
+                if session.headers.get("Authorization"):
+                    prefetched = graphql_fetch_trees(full_name, [parent_sha, sha], session=session, pkg_paths=pkg_files)
+                trees, pkgs = prefetched or ({}, {})
                 metrics_before = {"lines_of_code": 0, "avg_complexity": 0.0}
                 metrics_after = {"lines_of_code": 0, "avg_complexity": 0.0}
                 try:
-                    metrics_before = compute_metrics_from_commit(full_name, parent_sha, session=session, file_limit=file_limit)
+                    metrics_before = compute_metrics_from_commit(full_name, parent_sha, session=session, file_limit=file_limit, tree_items=trees.get(parent_sha))
                 except Exception as e:
                     print(f"[metrics] warning: failed computing metrics_before for {full_name}@{parent_sha}: {e}", flush=True)
                 try:
-                    metrics_after = compute_metrics_from_commit(full_name, sha, session=session, file_limit=file_limit)
+                    metrics_after = compute_metrics_from_commit(full_name, sha, session=session, file_limit=file_limit, tree_items=trees.get(sha))
                 except Exception as e:
                     print(f"[metrics] warning: failed computing metrics_after for {full_name}@{sha}: {e}", flush=True)
                 before_entry = {"lines_of_code": metrics_before.get("lines_of_code", 0), "avg_complexity": metrics_before.get("avg_complexity", 0.0)}
@@ -215,7 +419,7 @@ def analyze_repo(full_name, token=None, limit_commits=None, include_pkg_snapshot
                 for r in removed_list:
                     dep_name = r.get("name")
                     try:
-                        cve_count, cve_ids = get_cve_for_package(dep_name, session=session, cache=cache)
+                        cve_count, cve_ids = get_cve_for_package(dep_name, cache=cache)
                     except Exception:
                         cve_count, cve_ids = 0, []
                     candidate = {
@@ -236,14 +440,20 @@ def analyze_repo(full_name, token=None, limit_commits=None, include_pkg_snapshot
                         "metrics_after": after_entry,
                     }
                     if include_pkg_snapshots:
-                        try:
-                            pkg_before = fetch_package_json_at_ref(full_name, ref=parent_sha, path=r.get("file"), session=session) or {}
-                        except Exception:
-                            pkg_before = {}
-                        try:
-                            pkg_after = fetch_package_json_at_ref(full_name, ref=sha, path=r.get("file"), session=session) or {}
-                        except Exception:
-                            pkg_after = {}
+                        if (parent_sha, r.get("file")) in pkgs:
+                            pkg_before = pkgs[(parent_sha, r.get("file"))] or {}
+                        else:
+                            try:
+                                pkg_before = fetch_package_json_at_ref(full_name, ref=parent_sha, path=r.get("file"), session=session) or {}
+                            except Exception:
+                                pkg_before = {}
+                        if (sha, r.get("file")) in pkgs:
+                            pkg_after = pkgs[(sha, r.get("file"))] or {}
+                        else:
+                            try:
+                                pkg_after = fetch_package_json_at_ref(full_name, ref=sha, path=r.get("file"), session=session) or {}
+                            except Exception:
+                                pkg_after = {}
                         candidate["pkg_before"] = {r.get("file"): pkg_before}
                         candidate["pkg_after"] = {r.get("file"): pkg_after}
                     results.append(candidate)
@@ -252,11 +462,10 @@ def analyze_repo(full_name, token=None, limit_commits=None, include_pkg_snapshot
             except Exception as e:
                 print(f"Erro processando commit {sha} em {full_name}: {e}", flush=True)
                 continue
-        save_osv_cache(cache)
         if write_per_repo_file:
             os.makedirs(os.path.dirname(write_per_repo_file), exist_ok=True)
-            with open(write_per_repo_file, "w", encoding="utf-8") as f:
-                json.dump(results, f, indent=2, ensure_ascii=False)
+            with open(write_per_repo_file, "wb") as f:
+                f.write(_json.dumps(results, indent=True))
         return results
     finally:
         pass
@@ -267,9 +476,14 @@ if __name__ == "__main__":
     parser.add_argument("--limit", type=int, default=50)
     parser.add_argument("--include_pkg_snapshots", action="store_true")
     parser.add_argument("--max_candidates", type=int, default=1)
-    parser.add_argument("--days_back", type=int, default=365)
+    parser.add_argument("--days_back", type=int, default=365, help="só commits dos últimos N dias (0 desativa o filtro)")
     parser.add_argument("--file_limit", type=int, default=200, help="máx. arquivos JS/TS processados por commit")
+    parser.add_argument("--cache_dir", default=blob_cache.DEFAULT_CACHE_DIR, help="diretório do cache de blobs/trees ('' desativa)")
+    parser.add_argument("--accurate", action="store_true", help="usa lizard para a complexidade ciclomática (mais lento)")
     args = parser.parse_args()
+    blob_cache.configure(args.cache_dir)
+    set_accurate_cc(args.accurate)
+    start_cc_pool()
     res = analyze_repo(
         args.repo,
         token=os.getenv("GITHUB_TOKEN"),
@@ -281,4 +495,4 @@ if __name__ == "__main__":
         session=None,
         file_limit=args.file_limit
     )
-    print(json.dumps(res, indent=2, ensure_ascii=False))
\ No newline at end of file
+    sys.stdout.buffer.write(_json.dumps(res, indent=True) + b"\n")
\ No newline at end of file
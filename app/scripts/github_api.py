@@ -1,19 +1,64 @@
 import requests
+from requests.adapters import HTTPAdapter
+import asyncio
+import atexit
 import os
 import json
 import base64
+import binascii
 import time
 import random
-from urllib.parse import quote
+import threading
+from collections import OrderedDict
+from urllib.parse import quote, urlencode
+from app.scripts import _json, blob_cache
 
 from dotenv import load_dotenv
 load_dotenv()
 
+# optional httpx (cliente async; HTTP/2 se h2 estiver instalado)
+try:
+    import httpx
+    _HAVE_HTTPX = True
+except Exception:
+    _HAVE_HTTPX = False
+try:
+    import h2  # noqa: F401
+    _HAVE_H2 = True
+except Exception:
+    _HAVE_H2 = False
+
 GITHUB_API = "https://api.github.com"
 GITHUB_GRAPHQL = "https://api.github.com/graphql"
+HTTP_POOL_SIZE = 32
+
+# último X-RateLimit-* visto por cota (X-RateLimit-Resource: core, graphql, search, ...), compartilhado entre threads
+_rate_limits = {}
+
+def get_rate_limit(resource="core"):
+    """(remaining, reset) da cota `resource`; (None, None) enquanto nenhuma resposta dela foi vista."""
+    return _rate_limits.get(resource, (None, None))
+
+def _record_rate_limit(resp):
+    remaining = resp.headers.get("X-RateLimit-Remaining")
+    reset = resp.headers.get("X-RateLimit-Reset")
+    if remaining is None and reset is None:
+        return
+    resource = resp.headers.get("X-RateLimit-Resource") or "core"
+    try:
+        prev_remaining, prev_reset = _rate_limits.get(resource, (None, None))
+        _rate_limits[resource] = (
+            int(remaining) if remaining is not None else prev_remaining,
+            int(reset) if reset is not None else prev_reset,
+        )
+    except ValueError:
+        pass
 
 def make_session(token=None):
     s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
     token = token or os.getenv("GITHUB_TOKEN")
     if token:
         s.headers.update({
@@ -24,14 +69,13 @@ def make_session(token=None):
         s.headers.update({"User-Agent": "ti6-miner/1.0"})
     return s
 
-def _sleep_backoff(attempt, resp=None):
+def _backoff_delay(attempt, resp=None):
     if resp is not None:
         ra = resp.headers.get("Retry-After")
         if ra:
             try:
                 sec = int(ra)
-                time.sleep(sec + 1)
-                return
+                return sec + 1
             except Exception:
                 pass
         remaining = resp.headers.get("X-RateLimit-Remaining")
@@ -39,27 +83,85 @@ def _sleep_backoff(attempt, resp=None):
         if remaining == "0" and reset:
             try:
                 reset_ts = int(reset)
-                sleep_for = max(0, reset_ts - int(time.time()) + 2)
-                time.sleep(sleep_for)
-                return
+                return max(0, reset_ts - int(time.time()) + 2)
             except Exception:
                 pass
     base = min(60, (2 ** attempt))
     jitter = random.uniform(0.5, 2.0)
-    time.sleep(base + jitter)
+    return base + jitter
 
-def request_with_backoff(method, url, session=None, headers=None, params=None, json_body=None, timeout=30, max_retries=6):
+def _sleep_backoff(attempt, resp=None):
+    time.sleep(_backoff_delay(attempt, resp))
+
+# --- ETag cache: 304 Not Modified não consome a cota primária ---
+ETAG_CACHE_MAX = 512
+ETAG_CACHE_MAX_BYTES = 32 * 1024 * 1024  # limite da soma dos corpos guardados
+ETAG_ENTRY_MAX_BYTES = 1024 * 1024  # respostas maiores não entram no cache
+_etag_cache = OrderedDict()  # url_key -> (etag, status, headers, body)
+_etag_bytes = 0
+_etag_lock = threading.Lock()
+
+def _etag_key(url, params):
+    if not params:
+        return url
+    return url + "?" + urlencode(sorted(params.items()))
+
+def _etag_lookup(key):
+    with _etag_lock:
+        entry = _etag_cache.get(key)
+        if entry is not None:
+            _etag_cache.move_to_end(key)
+        return entry
+
+def _etag_store(key, resp):
+    global _etag_bytes
+    etag = resp.headers.get("ETag")
+    if not etag or resp.status_code != 200:
+        return
+    body = resp.content
+    if len(body) > ETAG_ENTRY_MAX_BYTES:
+        return
+    with _etag_lock:
+        old = _etag_cache.pop(key, None)
+        if old is not None:
+            _etag_bytes -= len(old[3])
+        _etag_cache[key] = (etag, resp.status_code, dict(resp.headers), body)
+        _etag_bytes += len(body)
+        while len(_etag_cache) > ETAG_CACHE_MAX or _etag_bytes > ETAG_CACHE_MAX_BYTES:
+            _, evicted = _etag_cache.popitem(last=False)
+            _etag_bytes -= len(evicted[3])
+
+def _response_from_etag_entry(entry, url):
+    _, status, headers, body = entry
+    resp = requests.Response()
+    resp.status_code = status
+    resp.headers.update(headers)
+    resp._content = body
+    resp.url = url
+    resp.encoding = "utf-8"
+    return resp
+
+def request_with_backoff(method, url, session=None, headers=None, params=None, json_body=None, timeout=30, max_retries=6, use_etag=False):
     s = session or make_session()
     req_headers = {}
     if headers:
         req_headers.update(headers)
+    etag_key = _etag_key(url, params) if use_etag and method == "GET" else None
+    etag_entry = _etag_lookup(etag_key) if etag_key else None
+    if etag_entry:
+        req_headers["If-None-Match"] = etag_entry[0]
     attempt = 0
     last_exc = None
     while attempt < max_retries:
         attempt += 1
         try:
             resp = s.request(method, url, headers=req_headers or None, params=params, json=json_body, timeout=timeout)
+            _record_rate_limit(resp)
+            if resp.status_code == 304 and etag_entry:
+                return _response_from_etag_entry(etag_entry, url)
             if resp.status_code < 400:
+                if etag_key:
+                    _etag_store(etag_key, resp)
                 return resp
             if resp.status_code in (429, 403, 502, 503, 504):
                 _sleep_backoff(attempt, resp)
@@ -120,8 +222,7 @@ def fetch_package_json_at_ref(repo_full_name, ref="HEAD", path="package.json", s
         return None
     if data.get("encoding") == "base64":
         try:
-            decoded = base64.b64decode(data.get("content", "")).decode("utf-8")
-            return json.loads(decoded)
+            return _json.loads(base64.b64decode(data.get("content", "")))
         except Exception:
             return None
     return None
@@ -133,7 +234,7 @@ def list_commits_touching_path(repo_full_name, path="package.json", session=None
     if params_extra:
         params.update(params_extra)
     try:
-        r = request_with_backoff("GET", url, session=session, params=params, timeout=20)
+        r = request_with_backoff("GET", url, session=session, params=params, timeout=20, use_etag=True)
     except Exception:
         return []
     if r.status_code == 404:
@@ -148,7 +249,7 @@ def get_commit_detail(repo_full_name, sha, session=None):
     session = session or make_session()
     url = f"{GITHUB_API}/repos/{repo_full_name}/commits/{sha}"
     try:
-        r = request_with_backoff("GET", url, session=session, timeout=20)
+        r = request_with_backoff("GET", url, session=session, timeout=20, use_etag=True)
     except Exception:
         return None
     if r.status_code != 200:
@@ -165,7 +266,7 @@ def _get_tree_sha_for_ref(repo_full_name, ref, session=None):
     session = session or make_session()
     url = f"{GITHUB_API}/repos/{repo_full_name}/commits/{ref}"
     try:
-        r = request_with_backoff("GET", url, session=session, timeout=20)
+        r = request_with_backoff("GET", url, session=session, timeout=20, use_etag=True)
     except Exception:
         return ref
     if r.status_code == 200:
@@ -208,86 +309,386 @@ def find_package_json_paths(repo_full_name, ref="HEAD", session=None):
 def get_tree_for_ref(repo_full_name, ref="HEAD", session=None):
     session = session or make_session()
     tree_sha = _get_tree_sha_for_ref(repo_full_name, ref, session=session)
+    # só cacheia quando o ref foi resolvido para o SHA da tree
+    return get_tree_by_sha(repo_full_name, tree_sha, session=session, use_cache=tree_sha != ref)
+
+def get_tree_by_sha(repo_full_name, tree_sha, session=None, use_cache=True):
+    session = session or make_session()
+    cache = blob_cache.get_cache() if use_cache else None
+    if cache is not None:
+        cached = cache.get_tree(tree_sha)
+        if cached is not None:
+            return cached
     url = f"{GITHUB_API}/repos/{repo_full_name}/git/trees/{tree_sha}"
     params = {"recursive": "1"}
     try:
+        # tree por SHA é imutável e já fica no cache SQLite: sem ETag
         r = request_with_backoff("GET", url, session=session, params=params, timeout=60)
         if r.status_code == 200:
             data = r.json()
             tree = data.get("tree", []) or []
+            if cache is not None and tree:
+                cache.put_tree(tree_sha, tree)
             return tree
     except Exception:
         pass
     return []
 
 def get_blob_content(repo_full_name, blob_sha, session=None):
+    cache = blob_cache.get_cache()
+    if cache is not None:
+        cached = cache.get_blob(blob_sha)
+        if cached is not None:
+            return cached
+    content = _fetch_blob_content(repo_full_name, blob_sha, session=session)
+    if cache is not None and content is not None:
+        cache.put_blob(blob_sha, content)
+    return content
+
+# blob cru (sem JSON/base64); se a API ignorar o Accept, cai no caminho base64
+BLOB_RAW_HEADERS = {"Accept": "application/vnd.github.raw+json"}
+
+def _fetch_blob_content(repo_full_name, blob_sha, session=None):
     session = session or make_session()
     url = f"{GITHUB_API}/repos/{repo_full_name}/git/blobs/{blob_sha}"
     try:
-        r = request_with_backoff("GET", url, session=session, timeout=60)
+        r = request_with_backoff("GET", url, session=session, headers=BLOB_RAW_HEADERS, timeout=60)
         if r.status_code != 200:
             return None
-        data = r.json()
-        content = data.get("content")
-        encoding = data.get("encoding")
-        if content and encoding == "base64":
-            try:
-                raw = base64.b64decode(content)
-                try:
-                    return raw.decode("utf-8", errors="replace")
-                except Exception:
-                    return raw.decode("latin-1", errors="replace")
-            except Exception:
-                return None
+        return _blob_text_from_response(r)
+    except Exception:
         return None
+
+def _blob_text_from_response(resp):
+    # raw+json: corpo cru (X-GitHub-Media-Type "...; param=raw"); só application/json é o envelope base64
+    media_type = (resp.headers.get("Content-Type") or "").split(";", 1)[0].strip().lower()
+    if media_type != "application/json" or "param=raw" in (resp.headers.get("X-GitHub-Media-Type") or ""):
+        return resp.content.decode("utf-8", errors="replace")
+    try:
+        data = resp.json()
+    except ValueError:
+        return resp.content.decode("utf-8", errors="replace")
+    if not isinstance(data, dict):
+        return resp.content.decode("utf-8", errors="replace")
+    content = data.get("content")
+    encoding = data.get("encoding")
+    if content and encoding == "base64":
+        try:
+            return binascii.a2b_base64(content).decode("utf-8", errors="replace")
+        except binascii.Error:
+            return None
+    return None
+
+# --- Async (httpx) blob fetch: muitos GETs multiplexados numa conexão HTTP/2 ---
+async def _arecord_rate_limit(resp):
+    _record_rate_limit(resp)
+
+def make_async_client(token=None, headers=None):
+    """headers: reaproveita os headers de uma requests.Session (Authorization/User-Agent)."""
+    if headers is None:
+        token = token or os.getenv("GITHUB_TOKEN")
+        headers = {"User-Agent": "ti6-miner/1.0"}
+        if token:
+            headers["Authorization"] = f"token {token}"
+    return httpx.AsyncClient(
+        headers=dict(headers),
+        http2=_HAVE_H2,
+        limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE),
+        timeout=60,
+        event_hooks={"response": [_arecord_rate_limit]},
+    )
+
+async def arequest_with_backoff(client, method, url, headers=None, params=None, json_body=None, max_retries=6):
+    attempt = 0
+    last_exc = None
+    while attempt < max_retries:
+        attempt += 1
+        try:
+            resp = await client.request(method, url, headers=headers, params=params, json=json_body)
+            if resp.status_code < 400:
+                return resp
+            if resp.status_code in (429, 403, 502, 503, 504):
+                await asyncio.sleep(_backoff_delay(attempt, resp))
+                last_exc = Exception(f"{resp.status_code} Client Error: {resp.text} for url: {url}")
+                continue
+            resp.raise_for_status()
+        except httpx.HTTPError as e:
+            last_exc = e
+            await asyncio.sleep(_backoff_delay(attempt, None))
+            continue
+    if last_exc:
+        raise last_exc
+    raise RuntimeError("arequest_with_backoff: exhausted retries.")
+
+async def aget_blob_content(repo_full_name, blob_sha, client):
+    cache = blob_cache.get_cache()
+    if cache is not None:
+        cached = cache.get_blob(blob_sha)
+        if cached is not None:
+            return cached
+    url = f"{GITHUB_API}/repos/{repo_full_name}/git/blobs/{blob_sha}"
+    try:
+        r = await arequest_with_backoff(client, "GET", url, headers=BLOB_RAW_HEADERS)
+        if r.status_code != 200:
+            return None
+        content = _blob_text_from_response(r)
     except Exception:
         return None
+    if cache is not None and content is not None:
+        cache.put_blob(blob_sha, content)
+    return content
+
+async def aiter_blob_contents(repo_full_name, blob_shas, client, concurrency=HTTP_POOL_SIZE):
+    """
+    Gera (sha, text) conforme os downloads terminam, com no máximo `concurrency` em voo:
+    só os textos ainda não consumidos ficam em memória.
+    """
+    shas = iter(blob_shas)
+    pending = {}
+
+    def start(sha):
+        pending[asyncio.ensure_future(aget_blob_content(repo_full_name, sha, client))] = sha
+
+    for sha in shas:
+        start(sha)
+        if len(pending) >= concurrency:
+            break
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                sha = pending.pop(task)
+                nxt = next(shas, None)
+                if nxt is not None:
+                    start(nxt)
+                yield sha, task.result()
+    finally:
+        # consumidor parou antes do fim: não deixa downloads pendurados no loop reaproveitado da thread
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+def iter_blob_contents(repo_full_name, blob_shas, session=None, concurrency=HTTP_POOL_SIZE):
+    """
+    Versão síncrona de aiter_blob_contents: retorna um gerador de (sha, text) em ordem de chegada,
+    ou None se httpx não estiver instalado.
+    """
+    if not _HAVE_HTTPX:
+        return None
+    session = session or make_session()
+    return _drive_blob_contents(repo_full_name, blob_shas, session.headers, concurrency)
+
+# um event loop + AsyncClient por thread, reaproveitados entre commits (conexões keep-alive/HTTP2 quentes)
+_async_local = threading.local()
+_async_clients = []
+_async_clients_lock = threading.Lock()
+
+def _thread_async_client(headers):
+    key = tuple(sorted((k, v) for k, v in dict(headers).items()))
+    state = getattr(_async_local, "state", None)
+    if state is None or state[0] != key:
+        if state is not None:
+            _close_async_client(state[1], state[2])
+        loop = asyncio.new_event_loop()
+        client = make_async_client(headers=headers)
+        state = (key, loop, client)
+        _async_local.state = state
+        with _async_clients_lock:
+            _async_clients.append((loop, client))
+    return state[1], state[2]
+
+def _close_async_client(loop, client):
+    with _async_clients_lock:
+        if (loop, client) in _async_clients:
+            _async_clients.remove((loop, client))
+    try:
+        loop.run_until_complete(client.aclose())
+    except Exception:
+        pass
+    loop.close()
+
+@atexit.register
+def _close_async_clients():
+    with _async_clients_lock:
+        pending = list(_async_clients)
+    for loop, client in pending:
+        _close_async_client(loop, client)
+
+def _drive_blob_contents(repo_full_name, blob_shas, headers, concurrency):
+    loop, client = _thread_async_client(headers)
+    agen = aiter_blob_contents(repo_full_name, blob_shas, client, concurrency=concurrency)
+    try:
+        while True:
+            try:
+                item = loop.run_until_complete(agen.__anext__())
+            except StopAsyncIteration:
+                break
+            yield item
+    finally:
+        loop.run_until_complete(agen.aclose())
 
 # --- GraphQL batch fetch for HEAD:package.json ---
+GRAPHQL_CONCURRENCY = 8
+
+def _package_json_batch_query(block, out):
+    """Monta a query de um bloco; repos com nome inválido vão direto para out como None."""
+    parts = []
+    alias_map = {}
+    for idx, full in enumerate(block):
+        try:
+            owner, name = full.split("/", 1)
+        except Exception:
+            out[full] = None
+            continue
+        alias = f"r{idx}"
+        expr = f"HEAD:package.json"
+        qpart = f'{alias}: repository(owner: "{owner}", name: "{name}") {{ object(expression: "{expr}") {{ ... on Blob {{ text }} }} }}'
+        parts.append(qpart)
+        alias_map[alias] = full
+    return "query { " + " ".join(parts) + " }", alias_map
+
+def _parse_package_json_batch(data, alias_map, out):
+    for alias, full in alias_map.items():
+        repo_obj = data.get(alias) if data else None
+        if not repo_obj:
+            out[full] = None
+            continue
+        obj = repo_obj.get("object")
+        if obj and obj.get("text") is not None:
+            try:
+                out[full] = _json.loads(obj.get("text"))
+            except Exception:
+                out[full] = None
+        else:
+            out[full] = None
+
+def _graphql_headers(token):
+    # GraphQL commonly expects 'bearer'; enviado por request, sem alterar a session compartilhada
+    return {"Authorization": f"bearer {token}"} if token else None
+
 def graphql_fetch_package_json_batch(repo_full_names, token=None, batch_size=40, session=None):
     """
     repo_full_names: list of "owner/repo"
     returns dict repo_full_name -> parsed package.json dict or None
     """
     token = token or os.getenv("GITHUB_TOKEN")
+    if _HAVE_HTTPX:
+        return asyncio.run(graphql_fetch_package_json_batch_async(repo_full_names, token=token, batch_size=batch_size))
     session = session or make_session(token)
-    if token:
-        # GraphQL commonly expects 'bearer', but requests with token also works; set both headers if needed
-        session.headers.update({"Authorization": f"bearer {token}"})
+    headers = _graphql_headers(token)
     out = {}
     for i in range(0, len(repo_full_names), batch_size):
         block = repo_full_names[i:i+batch_size]
-        parts = []
-        alias_map = {}
-        for idx, full in enumerate(block):
-            try:
-                owner, name = full.split("/", 1)
-            except Exception:
-                out[full] = None
-                continue
-            alias = f"r{idx}"
-            expr = f"HEAD:package.json"
-            qpart = f'{alias}: repository(owner: "{owner}", name: "{name}") {{ object(expression: "{expr}") {{ ... on Blob {{ text }} }} }}'
-            parts.append(qpart)
-            alias_map[alias] = full
-        query = "query { " + " ".join(parts) + " }"
+        query, alias_map = _package_json_batch_query(block, out)
         try:
-            resp = request_with_backoff("POST", GITHUB_GRAPHQL, session=session, json_body={"query": query}, timeout=30)
-            data = resp.json().get("data") if resp and resp.status_code == 200 else {}
-            for alias, full in alias_map.items():
-                repo_obj = data.get(alias) if data else None
-                if not repo_obj:
-                    out[full] = None
-                    continue
-                obj = repo_obj.get("object")
-                if obj and obj.get("text") is not None:
-                    try:
-                        out[full] = json.loads(obj.get("text"))
-                    except Exception:
-                        out[full] = None
-                else:
-                    out[full] = None
+            resp = request_with_backoff("POST", GITHUB_GRAPHQL, session=session, headers=headers, json_body={"query": query}, timeout=30)
+            data = _json.loads(resp.content).get("data") if resp and resp.status_code == 200 else {}
+            _parse_package_json_batch(data, alias_map, out)
         except Exception:
             for full in block:
                 out[full] = None
-    return out
\ No newline at end of file
+    return out
+
+async def _agraphql_batch(client, block, out):
+    query, alias_map = _package_json_batch_query(block, out)
+    try:
+        resp = await arequest_with_backoff(client, "POST", GITHUB_GRAPHQL, json_body={"query": query})
+        data = _json.loads(resp.content).get("data") if resp and resp.status_code == 200 else {}
+        _parse_package_json_batch(data, alias_map, out)
+    except Exception:
+        for full in block:
+            out[full] = None
+
+async def graphql_fetch_package_json_batch_async(repo_full_names, token=None, batch_size=40, concurrency=GRAPHQL_CONCURRENCY):
+    """Mesmo contrato de graphql_fetch_package_json_batch, com os blocos enviados em paralelo."""
+    token = token or os.getenv("GITHUB_TOKEN")
+    headers = {"User-Agent": "ti6-miner/1.0"}
+    headers.update(_graphql_headers(token) or {})
+    out = {}
+    sem = asyncio.Semaphore(concurrency)
+    async with make_async_client(headers=headers) as client:
+        async def one(block):
+            async with sem:
+                await _agraphql_batch(client, block, out)
+        await asyncio.gather(*(one(repo_full_names[i:i+batch_size]) for i in range(0, len(repo_full_names), batch_size)))
+    return out
+
+# --- GraphQL batch fetch of blob texts for one commit ---
+def graphql_iter_js_blobs_for_commit(repo_full_name, commit_sha, paths, session=None, chunk_size=50):
+    """
+    paths: blob paths (do tree recursivo) a buscar em commit_sha
+    Gera um dict path -> text (None para blobs binários/ausentes) por bloco de chunk_size aliases,
+    assim que cada POST responde; blobs com text truncado (isTruncated) ficam fora do dict; gera None e para se a API falhar (quem consome cai no REST para o resto).
+    """
+    session = session or make_session()
+    try:
+        owner, name = repo_full_name.split("/", 1)
+    except ValueError:
+        yield None
+        return
+    for i in range(0, len(paths), chunk_size):
+        block = paths[i:i+chunk_size]
+        parts = []
+        for idx, path in enumerate(block):
+            expr = json.dumps(f"{commit_sha}:{path}")
+            parts.append(f'b{idx}: object(expression: {expr}) {{ ... on Blob {{ text isBinary isTruncated }} }}')
+        query = f'query {{ repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) {{ {" ".join(parts)} }} }}'
+        try:
+            resp = request_with_backoff("POST", GITHUB_GRAPHQL, session=session, json_body={"query": query}, timeout=60)
+            data = resp.json().get("data") if resp and resp.status_code == 200 else None
+        except Exception:
+            data = None
+        repo_obj = (data or {}).get("repository")
+        if not repo_obj:
+            yield None
+            return
+        texts = {}
+        for idx, path in enumerate(block):
+            obj = repo_obj.get(f"b{idx}") or {}
+            if obj.get("isTruncated"):
+                # texto parcial: não entra no dict (nem no cache); quem consome busca pelo REST
+                continue
+            texts[path] = None if obj.get("isBinary") else obj.get("text")
+        yield texts
+
+# --- GraphQL: trees de vários commits (+ package.json) em um POST ---
+def graphql_fetch_trees(repo_full_name, commit_shas, session=None, pkg_paths=()):
+    """
+    Resolve a tree de cada commit e, opcionalmente, o texto de pkg_paths em cada um, numa única query.
+    GraphQL não lista trees recursivamente, então as entradas vêm de get_tree_by_sha (cacheada por SHA).
+    returns (trees, pkgs): {commit_sha: tree_entries}, {(commit_sha, path): parsed package.json or None};
+    None se a query falhar
+    """
+    session = session or make_session()
+    try:
+        owner, name = repo_full_name.split("/", 1)
+    except ValueError:
+        return None
+    parts = []
+    for ci, sha in enumerate(commit_shas):
+        parts.append(f'c{ci}: object(oid: {json.dumps(sha)}) {{ ... on Commit {{ tree {{ oid }} }} }}')
+        for pi, path in enumerate(pkg_paths):
+            parts.append(f'p{ci}_{pi}: object(expression: {json.dumps(f"{sha}:{path}")}) {{ ... on Blob {{ text }} }}')
+    query = f'query {{ repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) {{ {" ".join(parts)} }} }}'
+    try:
+        resp = request_with_backoff("POST", GITHUB_GRAPHQL, session=session, json_body={"query": query}, timeout=30)
+        data = resp.json().get("data") if resp and resp.status_code == 200 else None
+    except Exception:
+        return None
+    repo_obj = (data or {}).get("repository")
+    if not repo_obj:
+        return None
+    trees = {}
+    pkgs = {}
+    for ci, sha in enumerate(commit_shas):
+        tree_oid = ((repo_obj.get(f"c{ci}") or {}).get("tree") or {}).get("oid")
+        if tree_oid:
+            trees[sha] = get_tree_by_sha(repo_full_name, tree_oid, session=session)
+        for pi, path in enumerate(pkg_paths):
+            text = (repo_obj.get(f"p{ci}_{pi}") or {}).get("text")
+            try:
+                pkgs[(sha, path)] = _json.loads(text) if text is not None else None
+            except Exception:
+                pkgs[(sha, path)] = None
+    return trees, pkgs
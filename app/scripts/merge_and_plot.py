@@ -2,90 +2,168 @@
 """
 Função wrapper para merge + plots. Recebe lista de commits json files.
 """
+import math
 import os
-import json
+from app.scripts import _json
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 import numpy as np
 
+# optional ijson: lê os arrays de commits em streaming
+try:
+    import ijson
+    _HAVE_IJSON = True
+except Exception:
+    _HAVE_IJSON = False
+
+# optional numba: deltas + log1p num único kernel paralelo
+try:
+    from numba import njit, prange
+    _HAVE_NUMBA = True
+except Exception:
+    _HAVE_NUMBA = False
+
+PLOT_DPI = 100
+PNG_PIL_KWARGS = {"compress_level": 3, "optimize": False}
+
 def load_json(path):
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return _json.load(path)
+
+def iter_json_items(path):
+    """Itera os elementos de um array JSON (com ijson, sem carregar o arquivo inteiro) ou de um .jsonl[.gz]."""
+    if _json.is_jsonl(path):
+        yield from _json.iter_jsonl(path)
+    elif _HAVE_IJSON:
+        with open(path, "rb") as f:
+            yield from ijson.items(f, "item", use_float=True)
+    else:
+        yield from load_json(path)
+
+def save_plot(fig, path):
+    # PNG com compressão baixa e sem otimização: a busca de filtros do libpng domina o tempo de escrita
+    fig.savefig(path, dpi=PLOT_DPI, pil_kwargs=PNG_PIL_KWARGS)
+
+def _derive_numpy(lb, la, cb, ca):
+    dl = la - lb
+    dc = ca - cb
+    log_complex = np.column_stack((cb, ca)).astype(np.float32)
+    log_loc = np.column_stack((lb, la)).astype(np.float32)
+    for arr in (log_complex, log_loc):
+        np.clip(arr, 0, None, out=arr)
+        np.log1p(arr, out=arr)
+    return dl, dc, log_complex, log_loc
+
+if _HAVE_NUMBA:
+    @njit(parallel=True, cache=True)
+    def _derive_numba(lb, la, cb, ca):
+        n = lb.shape[0]
+        dl = np.empty(n, np.int64)
+        dc = np.empty(n, np.float64)
+        log_complex = np.empty((n, 2), np.float32)
+        log_loc = np.empty((n, 2), np.float32)
+        for i in prange(n):
+            dl[i] = la[i] - lb[i]
+            dc[i] = ca[i] - cb[i]
+            log_complex[i, 0] = math.log1p(max(cb[i], 0.0))
+            log_complex[i, 1] = math.log1p(max(ca[i], 0.0))
+            log_loc[i, 0] = math.log1p(max(lb[i], 0))
+            log_loc[i, 1] = math.log1p(max(la[i], 0))
+        return dl, dc, log_complex, log_loc
+
+def derive_columns(lb, la, cb, ca):
+    """
+    Uma passada sobre as colunas de métricas: retorna (delta_lines, delta_complex, log1p complexidade, log1p LOC),
+    os logs como arrays float32 (n, 2) [antes, depois] prontos para o boxplot.
+    """
+    if _HAVE_NUMBA:
+        return _derive_numba(lb, la, cb, ca)
+    return _derive_numpy(lb, la, cb, ca)
+
+def boxplot_before_after(ax, arr, labels):
+    sns.boxplot(data=arr, orient='v', ax=ax)
+    ax.set_xticks(range(len(labels)))
+    ax.set_xticklabels(labels)
+    ax.set_xlabel('when')
 
 def merge_and_plot_main(deps_json, commits_json_list, sonar_json, out_dataset, out_plots):
     # carregar deps (pode falhar/estar vazio)
     deps = load_json(deps_json) if deps_json and os.path.exists(deps_json) else []
-    # carregar commits: list of files -> concat
-    commits_all = []
+    # carregar commits em colunas (SoA): uma lista por coluna em vez de um dict por commit
+    repo, removed_dep = [], []
+    lines_before, lines_after, complex_before, complex_after = [], [], [], []
     for cj in commits_json_list or []:
         if os.path.exists(cj):
-            commits_all.extend(load_json(cj))
-    # build DF
-    rows = []
-    for c in commits_all:
-        before = c.get("metrics_before", {})
-        after = c.get("metrics_after", {})
-        rows.append({
-            "repo": c.get("repo"),
-            "removed_dep": c.get("removed_dep"),
-            "lines_before": before.get("lines_of_code", 0),
-            "lines_after": after.get("lines_of_code", 0),
-            "complex_before": before.get("avg_complexity", 0),
-            "complex_after": after.get("avg_complexity", 0),
-            "delta_lines": after.get("lines_of_code", 0) - before.get("lines_of_code", 0),
-            "delta_complex": after.get("avg_complexity", 0) - before.get("avg_complexity", 0),
-        })
-    df_commits = pd.DataFrame(rows)
+            for c in iter_json_items(cj):
+                mb = c.get("metrics_before") or {}
+                ma = c.get("metrics_after") or {}
+                repo.append(c.get("repo"))
+                removed_dep.append(c.get("removed_dep"))
+                lines_before.append(mb.get("lines_of_code") or 0)
+                lines_after.append(ma.get("lines_of_code") or 0)
+                complex_before.append(mb.get("avg_complexity") or 0)
+                complex_after.append(ma.get("avg_complexity") or 0)
+    n = len(repo)
+    lb = np.fromiter(lines_before, dtype=np.int64, count=n)
+    la = np.fromiter(lines_after, dtype=np.int64, count=n)
+    cb = np.fromiter(complex_before, dtype=np.float64, count=n)
+    ca = np.fromiter(complex_after, dtype=np.float64, count=n)
+    delta_lines, delta_complex, log_complex, log_loc = derive_columns(lb, la, cb, ca)
+    df_commits = pd.DataFrame({
+        "repo": repo,
+        "removed_dep": removed_dep,
+        "lines_before": lb,
+        "lines_after": la,
+        "complex_before": cb,
+        "complex_after": ca,
+        "delta_lines": delta_lines,
+        "delta_complex": delta_complex,
+    })
     # merge repo-level deps into commit df (defensivo: verifique coluna 'repo')
     if deps:
         df_deps = pd.DataFrame(deps)
         if 'repo' in df_deps.columns:
-            df = df_commits.merge(df_deps[['repo','dependencies','vulnerable_deps']], on='repo', how='left')
+            # deps indexado por repo + repo como category: join sem reconstruir a chave de hash em strings
+            df_deps = df_deps.set_index('repo')[['dependencies','vulnerable_deps']]
+            df_commits['repo'] = df_commits['repo'].astype('category')
+            df = df_commits.join(df_deps, on='repo')
         else:
             print("Aviso: arquivo de dependências não tem coluna 'repo' — pulando merge de dependências.")
             df = df_commits
     else:
         df = df_commits
     os.makedirs(os.path.dirname(out_dataset), exist_ok=True)
-    df.to_json(out_dataset, orient='records', indent=2)
+    df.to_json(out_dataset, orient='records')
     print(f"Saved merged dataset: {out_dataset}")
     # plots (mesma lógica anterior)
     os.makedirs(out_plots, exist_ok=True)
     if not df.empty:
-        df['log_complex_before'] = np.log1p(df['complex_before'].fillna(0).astype(float))
-        df['log_complex_after']  = np.log1p(df['complex_after'].fillna(0).astype(float))
-        df['log_lines_before']   = np.log1p(df['lines_before'].fillna(0).astype(float))
-        df['log_lines_after']    = np.log1p(df['lines_after'].fillna(0).astype(float))
+        # uma única figura/eixo reaproveitada pelos três gráficos; logs já vêm de derive_columns
+        fig, ax = plt.subplots(figsize=(8,6))
 
-        melt_complex = df[['log_complex_before','log_complex_after']].melt(var_name='when', value_name='log1p_complexity')
-        plt.figure(figsize=(8,6))
-        sns.boxplot(data=melt_complex, x='when', y='log1p_complexity')
-        plt.title("log1p(Complexidade média) antes vs depois")
-        plt.ylabel("log1p(avg_complexity)  (isto é, log(1 + x))")
-        plt.savefig(os.path.join(out_plots, "boxplot_complexity_before_after_log1p.png"))
-        plt.close()
+        boxplot_before_after(ax, log_complex, ['log_complex_before','log_complex_after'])
+        ax.set_title("log1p(Complexidade média) antes vs depois")
+        ax.set_ylabel("log1p(avg_complexity)  (isto é, log(1 + x))")
+        save_plot(fig, os.path.join(out_plots, "boxplot_complexity_before_after_log1p.png"))
 
-        melt_loc = df[['log_lines_before','log_lines_after']].melt(var_name='when', value_name='log1p_loc')
-        plt.figure(figsize=(8,6))
-        sns.boxplot(data=melt_loc, x='when', y='log1p_loc')
-        plt.title("log1p(LOC) antes vs depois")
-        plt.ylabel("log1p(lines_of_code)  (isto é, log(1 + x))")
-        plt.savefig(os.path.join(out_plots, "boxplot_loc_before_after_log1p.png"))
-        plt.close()
+        ax.clear()
+        boxplot_before_after(ax, log_loc, ['log_lines_before','log_lines_after'])
+        ax.set_title("log1p(LOC) antes vs depois")
+        ax.set_ylabel("log1p(lines_of_code)  (isto é, log(1 + x))")
+        save_plot(fig, os.path.join(out_plots, "boxplot_loc_before_after_log1p.png"))
 
         x = df.get('dependencies') if 'dependencies' in df.columns else pd.Series([0]*len(df))
         x = x.fillna(0)
         y = df['delta_complex'].fillna(0)
 
-        plt.figure(figsize=(8,6))
-        plt.scatter(x + 1e-6, y + 1e-6, alpha=0.6)
-        plt.xscale('log')
-        plt.yscale('symlog')
-        plt.xlabel("dependencies (repo) [log scale]")
-        plt.ylabel("delta_complex (after - before) [symlog]")
-        plt.title("delta_complex vs dependencies")
-        plt.grid(True, which="both", ls="--", lw=0.5)
-        plt.savefig(os.path.join(out_plots, "scatter_delta_complex_vs_dependencies_log.png"))
-        plt.close()
+        ax.clear()
+        ax.scatter(x + 1e-6, y + 1e-6, alpha=0.6)
+        ax.set_xscale('log')
+        ax.set_yscale('symlog')
+        ax.set_xlabel("dependencies (repo) [log scale]")
+        ax.set_ylabel("delta_complex (after - before) [symlog]")
+        ax.set_title("delta_complex vs dependencies")
+        ax.grid(True, which="both", ls="--", lw=0.5)
+        save_plot(fig, os.path.join(out_plots, "scatter_delta_complex_vs_dependencies_log.png"))
+        plt.close(fig)
     print(f"Plots saved to {out_plots}")
\ No newline at end of file
@@ -1,50 +1,183 @@
-import json
+import atexit
 import os
-import time
+import sys
+import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from app.scripts import _json
 from app.scripts.github_api import fetch_package_json_at_ref, find_package_json_paths, make_session, graphql_fetch_package_json_batch
 from dotenv import load_dotenv
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 load_dotenv()
 
 OSV_URL = "https://api.osv.dev/v1/query"
+OSV_BATCH_URL = "https://api.osv.dev/v1/querybatch"
+OSV_BATCH_SIZE = 1000
 OSV_CACHE = os.path.join("app", "results", "osv_cache.json")
 
-def load_osv_cache():
-    try:
-        with open(OSV_CACHE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {}
+OSV_CACHE_LOG_SUFFIX = ".log.jsonl"  # sidecar append-only com as inserções desde a última compactação
+
+class OsvCache(dict):
+    """
+    dict pacote -> (count, ids) compartilhado pelo processo.
+    Cada inserção é anexada ao log JSONL ao lado do cache; o JSON compacto só é regravado por flush() (no exit).
+    """
+    def __init__(self, *args, path=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.path = path or OSV_CACHE
+        self.log_path = self.path + OSV_CACHE_LOG_SUFFIX
+        self.dirty = False
+        self._log = None
+        self._lock = threading.Lock()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        count, ids = value
+        line = _json.dumps({"name": key, "count": count, "ids": ids}) + b"\n"
+        with self._lock:
+            self.dirty = True
+            try:
+                if self._log is None:
+                    os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+                    # sem buffer + O_APPEND: cada linha é um write() atômico, mesmo com processos filhos
+                    self._log = open(self.log_path, "ab", buffering=0)
+                self._log.write(line)
+            except OSError:
+                pass
+
+    def replay_log(self):
+        """Aplica o log pendente (ex.: de um run interrompido) sobre o dict, sem marcá-lo no log de novo."""
+        for name, value in _read_osv_log(self.log_path).items():
+            dict.__setitem__(self, name, value)
 
-def save_osv_cache(cache):
+    def flush(self):
+        """Compacta: regrava o JSON com disco + log + memória e trunca o log."""
+        with self._lock:
+            if not self.dirty and not os.path.exists(self.log_path):
+                return
+            try:
+                try:
+                    snapshot = _json.load(self.path)
+                except Exception:
+                    snapshot = {}
+                # o log pode ter linhas de outros processos que escreveram no mesmo cache
+                snapshot.update(_read_osv_log(self.log_path))
+                snapshot.update(self)
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                tmp = self.path + ".tmp"
+                # arquivo lido só por máquina: sem indent
+                _json.dump(snapshot, tmp)
+                os.replace(tmp, self.path)
+                if self._log is not None:
+                    self._log.close()
+                    self._log = None
+                if os.path.exists(self.log_path):
+                    os.remove(self.log_path)
+                self.dirty = False
+            except Exception:
+                pass
+
+def _read_osv_log(log_path):
+    entries = {}
     try:
-        os.makedirs(os.path.dirname(OSV_CACHE), exist_ok=True)
-        with open(OSV_CACHE, "w", encoding="utf-8") as f:
-            json.dump(cache, f, indent=2, ensure_ascii=False)
+        for rec in _json.iter_jsonl(log_path):
+            entries[rec["name"]] = (rec.get("count", 0), [sys.intern(i) for i in rec.get("ids") or ()])
+    except FileNotFoundError:
+        pass
     except Exception:
+        # linha truncada no fim (processo morto no meio do write): mantém o que foi lido
         pass
+    return entries
 
-def get_cve_for_package(package_name, session=None, cache=None):
-    if cache is None:
-        cache = {}
-    if package_name in cache:
-        return cache[package_name]
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+def load_osv_cache():
+    """Cache OSV do processo: JSON + log lidos uma vez; compactado no exit (atexit)."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            try:
+                data = {name: (count, [sys.intern(i) for i in ids or ()]) for name, (count, ids) in _json.load(OSV_CACHE).items()}
+            except Exception:
+                data = {}
+            _shared_cache = OsvCache(data, path=OSV_CACHE)
+            _shared_cache.replay_log()
+            atexit.register(_shared_cache.flush)
+        return _shared_cache
+
+OSV_POOL_SIZE = 16
+OSV_FALLBACK_WORKERS = 16
+_osv_session = None
+_osv_session_lock = threading.Lock()
+
+def make_osv_session(pool_size=OSV_POOL_SIZE):
+    """Session do OSV: pool de conexões keep-alive, retry em 429/5xx e sem o token do GitHub."""
+    s = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504], allowed_methods=frozenset({"POST"}))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    s.mount("https://", adapter)
+    s.headers.update({"User-Agent": "ti6-miner/1.0"})
+    return s
+
+def get_osv_session():
+    global _osv_session
+    with _osv_session_lock:
+        if _osv_session is None:
+            _osv_session = make_osv_session()
+        return _osv_session
+
+def _vuln_ids(vulns):
+    # ids internados: o mesmo CVE/GHSA aparece em vários pacotes e repos
+    return [sys.intern(v["id"]) for v in vulns if v.get("id")]
+
+def _query_osv_package(package_name, session=None):
     payload = {"package": {"name": package_name, "ecosystem": "npm"}}
-    s = session or requests
+    s = session or get_osv_session()
     try:
         r = s.post(OSV_URL, json=payload, timeout=10)
         if r.status_code == 200:
             vulns = r.json().get("vulns", [])
-            result = (len(vulns), [v.get("id") for v in vulns])
-            cache[package_name] = result
-            return result
+            return (len(vulns), _vuln_ids(vulns))
     except Exception:
         pass
-    cache[package_name] = (0, [])
     return (0, [])
 
+def get_cve_for_packages_batch(names, session=None, cache=None):
+    """
+    Consulta o OSV via /v1/querybatch (até OSV_BATCH_SIZE pacotes por POST), só para os nomes fora do cache.
+    returns dict name -> (count, ids); o cache é atualizado no lugar
+    """
+    if cache is None:
+        cache = {}
+    miss = [n for n in dict.fromkeys(names) if n not in cache]
+    s = session or get_osv_session()
+    for i in range(0, len(miss), OSV_BATCH_SIZE):
+        block = miss[i:i+OSV_BATCH_SIZE]
+        payload = {"queries": [{"package": {"name": n, "ecosystem": "npm"}} for n in block]}
+        results = None
+        try:
+            r = s.post(OSV_BATCH_URL, json=payload, timeout=60)
+            if r.status_code == 200:
+                results = r.json().get("results", [])
+        except Exception:
+            pass
+        if results is None or len(results) != len(block):
+            # batch falhou: consulta pacote a pacote, em paralelo na mesma session
+            with ThreadPoolExecutor(max_workers=min(OSV_FALLBACK_WORKERS, len(block))) as ex:
+                for n, result in zip(block, ex.map(lambda n: _query_osv_package(n, session=s), block)):
+                    cache[n] = result
+            continue
+        for n, res in zip(block, results):
+            vulns = (res or {}).get("vulns", []) or []
+            cache[n] = (len(vulns), _vuln_ids(vulns))
+    return {n: cache[n] for n in names}
+
+def get_cve_for_package(package_name, session=None, cache=None):
+    return get_cve_for_packages_batch([package_name], session=session, cache=cache)[package_name]
+
 def compute_metrics_for_repo(pkg_jsons, repo_name, token=None, session=None, osv_cache=None):
     metrics = {
         "repo": repo_name,
@@ -57,35 +190,30 @@ def compute_metrics_for_repo(pkg_jsons, repo_name, token=None, session=None, osv
     if not pkg_jsons:
         return metrics
 
-    deps_agg = {}
-    dev_deps_agg = {}
+    # só os nomes importam (versões não são usadas): acumula em sets
+    dep_names = set()
+    dev_names = set()
     paths = [p for p,_ in pkg_jsons]
     for path, pkg in pkg_jsons:
-        deps = pkg.get("dependencies", {}) or {}
-        dev = pkg.get("devDependencies", {}) or {}
-        for k,v in deps.items():
-            if k not in deps_agg:
-                deps_agg[k] = v
-        for k,v in dev.items():
-            if k not in dev_deps_agg:
-                dev_deps_agg[k] = v
-
-    metrics["dependencies"] = len(deps_agg)
-    metrics["dev_dependencies"] = len(dev_deps_agg)
+        dep_names.update(pkg.get("dependencies") or ())
+        dev_names.update(pkg.get("devDependencies") or ())
+
+    metrics["dependencies"] = len(dep_names)
+    metrics["dev_dependencies"] = len(dev_names)
     metrics["path_used"] = ",".join(paths) if paths else ""
 
     cache = osv_cache if osv_cache is not None else load_osv_cache()
     total_vulns = 0
-    cve_list = []
-    session = session or requests
-    for dep in deps_agg.keys():
-        count, ids = get_cve_for_package(dep, session=session, cache=cache)
+    cve_set = set()
+    session = session or get_osv_session()
+    cves_by_dep = get_cve_for_packages_batch(list(dep_names), session=session, cache=cache)
+    for count, ids in cves_by_dep.values():
         total_vulns += count
         if ids:
-            cve_list.extend(ids)
+            cve_set.update(ids)
 
     metrics["vulnerable_deps"] = total_vulns
-    metrics["cves"] = sorted(list(set(cve_list)))
+    metrics["cves"] = sorted(cve_set)
     return metrics
 
 def get_metrics_batch(repos, token=None, workers=4, session=None, graphql_batch=40):
@@ -96,11 +224,22 @@ def get_metrics_batch(repos, token=None, workers=4, session=None, graphql_batch=
     results = []
     session = session or make_session(token)
     shared_cache = load_osv_cache()
+    max_workers = min(workers or 4, max(1, len(repos)))
+    osv_session = make_osv_session(pool_size=max_workers * 4)
 
     repo_names = [r.get("repo") or r.get("name") for r in repos]
     # GraphQL batch to fetch package.json at HEAD for many repos
     pkg_map = graphql_fetch_package_json_batch(repo_names, token=token, batch_size=graphql_batch, session=session)
 
+    # nomes de pacote deduplicados (e internados) entre todos os repos: um único lote ao OSV,
+    # depois process() só lê do cache (exceto repos que caem no fallback REST)
+    all_deps = set()
+    for pkg in pkg_map.values():
+        if pkg:
+            all_deps.update(sys.intern(k) for k in (pkg.get("dependencies") or ()))
+    if all_deps:
+        get_cve_for_packages_batch(sorted(all_deps.difference(shared_cache)), session=osv_session, cache=shared_cache)
+
     def process(repo):
         repo_name = repo.get("repo") or repo.get("name")
         # GraphQL gave us the root package.json only; we still look for monorepo package.jsons via trees if needed
@@ -118,13 +257,12 @@ def get_metrics_batch(repos, token=None, workers=4, session=None, graphql_batch=
                         pkg_jsons.append((p,pj))
             except Exception:
                 pass
-        metrics = compute_metrics_for_repo(pkg_jsons, repo_name, token=token, session=session, osv_cache=shared_cache)
+        metrics = compute_metrics_for_repo(pkg_jsons, repo_name, token=token, session=osv_session, osv_cache=shared_cache)
         metrics["repo"] = repo_name
         metrics["stars"] = repo.get("stars") or repo.get("stargazers_count", 0)
         metrics["forks"] = repo.get("forks") or repo.get("forks_count", 0)
         return metrics
 
-    max_workers = min(workers or 4, max(1, len(repos)))
     with ThreadPoolExecutor(max_workers=max_workers) as ex:
         futures = {ex.submit(process, r): r for r in repos}
         for fut in as_completed(futures):
@@ -133,5 +271,4 @@ def get_metrics_batch(repos, token=None, workers=4, session=None, graphql_batch=
             except Exception as e:
                 print("Erro get_metrics_batch:", e)
 
-    save_osv_cache(shared_cache)
     return results
\ No newline at end of file
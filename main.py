@@ -1,14 +1,15 @@
 import argparse
+import csv
 import os
-import json
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
-import pandas as pd
-from app.scripts.github_api import get_top_js_repos, make_session
-from app.scripts.metrics import get_metrics_batch
-from app.scripts.find_dependency_replacements import analyze_repo
+from app.scripts.github_api import get_rate_limit, get_top_js_repos, make_session
+from app.scripts.metrics import get_metrics_batch, load_osv_cache
+from app.scripts.find_dependency_replacements import analyze_repo, set_accurate_cc, start_cc_pool
 from app.scripts.merge_and_plot import merge_and_plot_main
+from app.scripts import _json, blob_cache, find_dependency_replacements
 
 load_dotenv()
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
@@ -16,112 +17,263 @@ GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 RESULTS_DIR = os.path.join("app", "results")
 os.makedirs(RESULTS_DIR, exist_ok=True)
 
-def stage_deps(limit, workers, out_json, session=None):
-    session = session or make_session(GITHUB_TOKEN)
-    repos = get_top_js_repos(limit=limit, session=session)
-    summaries = get_metrics_batch(repos, token=GITHUB_TOKEN, workers=workers, session=session)
-    with open(out_json, "w", encoding="utf-8") as f:
-        json.dump(summaries, f, indent=2, ensure_ascii=False)
-    print(f"Saved deps JSON: {out_json}", flush=True)
+@dataclass(frozen=True, slots=True)
+class PipelineConfig:
+    """Configuração do pipeline, resolvida uma vez em main() e repassada a todos os estágios."""
+    token: str = None
+    limit: int = 100
+    workers: int = 4
+    mining_workers: int = 2
+    mining_sample: int = 50  # None = todos os repos
+    mining_processes: int = 0
+    include_pkg_snapshots: bool = False
+    deps_out: str = os.path.join(RESULTS_DIR, "dependencies_cve_summary.json")
+    mining_json_out: str = os.path.join(RESULTS_DIR, "commit_changes_all.json")
+    mining_csv_out: str = os.path.join(RESULTS_DIR, "commit_changes_all.csv")
+    plots: str = os.path.join(RESULTS_DIR, "plots")
+    final_out: str = os.path.join(RESULTS_DIR, "final_dataset.json")
+    max_candidates: int = 1
+    days_back: int = 365
+    chunk_size: int = 50
+    file_limit: int = 200
+    cache_dir: str = blob_cache.DEFAULT_CACHE_DIR
+    accurate: bool = False
+
+    @classmethod
+    def from_args(cls, args, token=None):
+        return cls(
+            token=token,
+            limit=args.limit,
+            workers=args.workers,
+            mining_workers=args.mining_workers,
+            mining_sample=None if args.mining_sample == 0 else args.mining_sample,
+            mining_processes=args.mining_processes,
+            deps_out=args.deps_out,
+            mining_json_out=args.mining_json_out,
+            mining_csv_out=args.mining_csv_out,
+            plots=args.plots,
+            final_out=args.final_out,
+            max_candidates=args.max_candidates,
+            days_back=args.days_back,
+            chunk_size=args.chunk_size,
+            file_limit=args.file_limit,
+            cache_dir=args.cache_dir,
+            accurate=args.accurate,
+        )
+
+def stage_deps(cfg, session):
+    repos = get_top_js_repos(limit=cfg.limit, session=session)
+    summaries = get_metrics_batch(repos, token=cfg.token, workers=cfg.workers, session=session)
+    _json.dump(summaries, cfg.deps_out, indent=True)
+    print(f"Saved deps JSON: {cfg.deps_out}", flush=True)
     return summaries
 
-def chunked_iterable(it, chunk_size):
-    for i in range(0, len(it), chunk_size):
-        yield it[i:i+chunk_size]
+CSV_COLUMNS = ["repo", "commit", "parent", "commit_date", "commit_message", "removed_dep", "version_before", "version_after", "cve_count", "cve_ids", "lines_before", "lines_after", "complex_before", "complex_after"]
+
+def candidate_csv_row(c):
+    rd = c.get("removed_dep_details", {}) or {}
+    mb = c.get("metrics_before", {})
+    ma = c.get("metrics_after", {})
+    return [
+        c.get("repo"),
+        c.get("commit"),
+        c.get("parent"),
+        c.get("commit_date"),
+        c.get("commit_message"),
+        c.get("removed_dep"),
+        rd.get("versions_before"),
+        rd.get("versions_after"),
+        rd.get("cve_count", 0),
+        ";".join(rd.get("cve_ids") or []),
+        mb.get("lines_of_code"),
+        ma.get("lines_of_code"),
+        mb.get("avg_complexity"),
+        ma.get("avg_complexity"),
+    ]
+
+def pace_rate_limit(workers):
+    """Na fronteira de chunk: só dorme se a cota da API estiver perto do fim (até o reset informado pelo GitHub)."""
+    # a mineração gasta sobretudo a cota REST (core); GraphQL/search têm cotas próprias
+    remaining, reset = get_rate_limit("core")
+    if remaining is None or reset is None or remaining >= workers * 2:
+        return
+    delay = max(0, reset - time.time())
+    if delay:
+        print(f"Rate limit low ({remaining} remaining); sleeping {delay:.0f}s until reset", flush=True)
+        time.sleep(delay)
+
+# estado dos workers de mineração em processo (--mining_processes)
+_worker_session = None
+_worker_token = None
 
-def stage_mining_aggregate(deps_json, sample=None, workers=2, include_pkg_snapshots=False, out_json=None, out_csv=None, session=None, max_candidates=1, days_back=None, chunk_size=50, file_limit=200):
-    with open(deps_json, "r", encoding="utf-8") as f:
-        repos = json.load(f)
+def init_mining_worker(cfg):
+    """Initializer do ProcessPoolExecutor: cada processo cria a sua session e o seu cache."""
+    global _worker_session, _worker_token
+    blob_cache.configure(cfg.cache_dir)
+    set_accurate_cc(cfg.accurate)
+    # o próprio pool de processos já paraleliza a CPU: sem pool de complexidade aninhado
+    find_dependency_replacements.CC_WORKERS = 1
+    _worker_token = cfg.token
+    _worker_session = make_session(cfg.token)
+
+def mine_repo_in_worker(repo, **kwargs):
+    return analyze_repo(repo, token=_worker_token, session=_worker_session, **kwargs)
+
+def stage_mining_aggregate(cfg, session, return_candidates=False):
+    """
+    Minera os repos e grava JSONL/CSV linha a linha conforme cada repo termina.
+    Os candidatos só ficam em memória se return_candidates=True ou se a saída for .json (array único).
+    """
+    sample = cfg.mining_sample
+    workers = cfg.mining_workers
+    processes = cfg.mining_processes
+    chunk_size = cfg.chunk_size
+    out_json = cfg.mining_json_out
+    out_csv = cfg.mining_csv_out
+    repos = _json.load(cfg.deps_out)
     repo_names = [r["repo"] for r in repos]
     if sample:
         repo_names = repo_names[:sample]
     total = len(repo_names)
-    print(f"Mining {total} repos (sample={sample}) in chunks of {chunk_size} with workers={workers} ...", flush=True)
-    all_candidates = []
-    session = session or make_session(GITHUB_TOKEN)
+    print(f"Mining {total} repos (sample={sample}) in chunks of {chunk_size} with {f'processes={processes}' if processes > 0 else f'workers={workers}'} ...", flush=True)
+    keep = return_candidates or bool(out_json and not _json.is_jsonl(out_json))
+    all_candidates = [] if keep else None
+    n_candidates = 0
     processed = 0
-    for chunk_idx, chunk in enumerate(chunked_iterable(repo_names, chunk_size), start=1):
-        start_time = time.time()
-        # print(f"Processing chunk {chunk_idx} ({len(chunk)} repos). Processed so far: {processed}/{total}", flush=True)
-        with ThreadPoolExecutor(max_workers=workers) as ex:
-            futures = {ex.submit(analyze_repo, repo, token=GITHUB_TOKEN, limit_commits=50, include_pkg_snapshots=include_pkg_snapshots, write_per_repo_file=None, max_candidates_per_repo=max_candidates, days_back=days_back, session=session, file_limit=file_limit): repo for repo in chunk}
-            for fut in as_completed(futures):
-                repo = futures[fut]
-                try:
-                    res = fut.result()
-                    if res:
-                        all_candidates.extend(res)
-                    print(f"Done mining {repo} -> {len(res or [])} candidates", flush=True)
-                except Exception as e:
-                    print(f"Mining failed for {repo}: {e}", flush=True)
-        processed += len(chunk)
-        elapsed = time.time() - start_time
-        print(f"Finished chunk {chunk_idx} in {elapsed:.1f}s. Total candidates so far: {len(all_candidates)}", flush=True)
-        time.sleep(1)
-    if out_json:
+    chunk_idx = 0
+    start_time = time.time()
+
+    def collect(fut):
+        nonlocal processed, chunk_idx, start_time, n_candidates
+        repo = futures.pop(fut)
+        try:
+            res = fut.result()
+            if res:
+                n_candidates += len(res)
+                if keep:
+                    all_candidates.extend(res)
+                # grava assim que o repo termina: sem serialização gigante no fim do run
+                for c in res:
+                    if jsonl_out is not None:
+                        _json.write_jsonl_line(jsonl_out, c)
+                    if csv_writer is not None:
+                        csv_writer.writerow(candidate_csv_row(c))
+            print(f"Done mining {repo} -> {len(res or [])} candidates", flush=True)
+        except Exception as e:
+            print(f"Mining failed for {repo}: {e}", flush=True)
+        processed += 1
+        # chunk_size agora só define a granularidade do log de progresso
+        if processed % chunk_size == 0 or processed == total:
+            chunk_idx += 1
+            elapsed = time.time() - start_time
+            print(f"Finished chunk {chunk_idx} in {elapsed:.1f}s. Total candidates so far: {n_candidates}", flush=True)
+            # em modo processos a cota é vista só pelos workers (que já fazem backoff em 403/429)
+            if processes <= 0 and processed < total:
+                pace_rate_limit(workers)
+            start_time = time.time()
+
+    # um único pool para todos os repos, alimentado por uma janela de futures em voo:
+    # as conexões da session ficam quentes e não há barreira entre chunks
+    futures = {}
+    repo_kwargs = dict(limit_commits=50, include_pkg_snapshots=cfg.include_pkg_snapshots, write_per_repo_file=None, max_candidates_per_repo=cfg.max_candidates, days_back=cfg.days_back, file_limit=cfg.file_limit)
+    # carrega o cache OSV no processo principal: registra a compactação do log no exit
+    # (com --mining_processes os workers só anexam ao log e nunca compactam)
+    load_osv_cache()
+    if processes > 0:
+        # repos inteiros em processos (análise de JS é CPU-bound); a rede de cada repo segue em threads dentro do worker
+        ex = ProcessPoolExecutor(max_workers=processes, initializer=init_mining_worker, initargs=(cfg,))
+        submit = lambda repo: ex.submit(mine_repo_in_worker, repo, **repo_kwargs)
+        max_in_flight = processes * 4
+    else:
+        # pool de complexidade criado aqui, na thread principal, antes das threads de mineração
+        start_cc_pool()
+        ex = ThreadPoolExecutor(max_workers=workers)
+        submit = lambda repo: ex.submit(analyze_repo, repo, token=cfg.token, session=session, **repo_kwargs)
+        max_in_flight = max(1, workers) * 4
+    jsonl_out = None
+    csv_file = None
+    csv_writer = None
+    try:
+        if out_json and _json.is_jsonl(out_json):
+            os.makedirs(os.path.dirname(out_json), exist_ok=True)
+            jsonl_out = _json.open_jsonl(out_json, "wb")
+        if out_csv:
+            os.makedirs(os.path.dirname(out_csv), exist_ok=True)
+            # csv.writer linha a linha (sem lista de dicts nem DataFrame intermediário)
+            csv_file = open(out_csv, "w", newline="", encoding="utf-8")
+            csv_writer = csv.writer(csv_file)
+            csv_writer.writerow(CSV_COLUMNS)
+        with ex:
+            for repo in repo_names:
+                if len(futures) >= max_in_flight:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        collect(fut)
+                futures[submit(repo)] = repo
+            for fut in as_completed(list(futures)):
+                collect(fut)
+    finally:
+        if jsonl_out is not None:
+            jsonl_out.close()
+        if csv_file is not None:
+            csv_file.close()
+    if jsonl_out is not None:
+        print(f"Saved aggregated mining JSONL: {out_json}", flush=True)
+    elif out_json:
         os.makedirs(os.path.dirname(out_json), exist_ok=True)
-        with open(out_json, "w", encoding="utf-8") as f:
-            json.dump(all_candidates, f, indent=2, ensure_ascii=False)
+        _json.dump(all_candidates, out_json, indent=True)
         print(f"Saved aggregated mining JSON: {out_json}", flush=True)
     if out_csv:
-        rows = []
-        for c in all_candidates:
-            rd = c.get("removed_dep_details", {}) or {}
-            rows.append({
-                "repo": c.get("repo"),
-                "commit": c.get("commit"),
-                "parent": c.get("parent"),
-                "commit_date": c.get("commit_date"),
-                "commit_message": c.get("commit_message"),
-                "removed_dep": c.get("removed_dep"),
-                "version_before": rd.get("versions_before"),
-                "version_after": rd.get("versions_after"),
-                "cve_count": rd.get("cve_count", 0),
-                "cve_ids": ";".join(rd.get("cve_ids") or []),
-                "lines_before": c.get("metrics_before", {}).get("lines_of_code"),
-                "lines_after": c.get("metrics_after", {}).get("lines_of_code"),
-                "complex_before": c.get("metrics_before", {}).get("avg_complexity"),
-                "complex_after": c.get("metrics_after", {}).get("avg_complexity"),
-            })
-        df = pd.DataFrame(rows)
-        os.makedirs(os.path.dirname(out_csv), exist_ok=True)
-        df.to_csv(out_csv, index=False)
         print(f"Saved aggregated mining CSV: {out_csv}", flush=True)
-    return all_candidates
+    return all_candidates if return_candidates else None
+
+def stage_merge(cfg):
+    if not os.path.exists(cfg.mining_json_out):
+        # sem mineração não há o que juntar; não sobrescreve o final_out com um dataset vazio
+        print(f"[merge] warning: {cfg.mining_json_out} não encontrado; merge ignorado", flush=True)
+        return
+    merge_and_plot_main(cfg.deps_out, [cfg.mining_json_out], None, cfg.final_out, cfg.plots)
+    print(f"Merge done -> {cfg.final_out} and plots at {cfg.plots}", flush=True)
 
 def main():
+    defaults = PipelineConfig()
     parser = argparse.ArgumentParser()
     parser.add_argument("--stage", choices=["deps","mining","merge","all"], default="all")
-    parser.add_argument("--limit", type=int, default=100)
-    parser.add_argument("--workers", type=int, default=4)
-    parser.add_argument("--mining_workers", type=int, default=2)
-    parser.add_argument("--mining_sample", type=int, default=50)
-    parser.add_argument("--deps_out", default=os.path.join(RESULTS_DIR,"dependencies_cve_summary.json"))
-    parser.add_argument("--mining_json_out", default=os.path.join(RESULTS_DIR,"commit_changes_all.json"))
-    parser.add_argument("--mining_csv_out", default=os.path.join(RESULTS_DIR,"commit_changes_all.csv"))
-    parser.add_argument("--plots", default=os.path.join(RESULTS_DIR,"plots"))
-    parser.add_argument("--final_out", default=os.path.join(RESULTS_DIR,"final_dataset.json"))
-    parser.add_argument("--max_candidates", type=int, default=1)
-    parser.add_argument("--days_back", type=int, default=365)
-    parser.add_argument("--chunk_size", type=int, default=50)
-    parser.add_argument("--file_limit", type=int, default=200, help="máx. arquivos JS/TS processados por commit")
+    parser.add_argument("--limit", type=int, default=defaults.limit)
+    parser.add_argument("--workers", type=int, default=defaults.workers)
+    parser.add_argument("--mining_workers", type=int, default=defaults.mining_workers)
+    parser.add_argument("--mining_sample", type=int, default=defaults.mining_sample)
+    parser.add_argument("--deps_out", default=defaults.deps_out)
+    parser.add_argument("--mining_json_out", default=defaults.mining_json_out, help=".json (padrão) grava tudo no fim; .jsonl[.gz] grava um candidato por linha durante a mineração")
+    parser.add_argument("--mining_csv_out", default=defaults.mining_csv_out)
+    parser.add_argument("--plots", default=defaults.plots)
+    parser.add_argument("--final_out", default=defaults.final_out)
+    parser.add_argument("--max_candidates", type=int, default=defaults.max_candidates)
+    parser.add_argument("--days_back", type=int, default=defaults.days_back, help="só commits dos últimos N dias (0 desativa o filtro)")
+    parser.add_argument("--chunk_size", type=int, default=defaults.chunk_size)
+    parser.add_argument("--file_limit", type=int, default=defaults.file_limit, help="máx. arquivos JS/TS processados por commit")
+    parser.add_argument("--cache_dir", default=defaults.cache_dir, help="diretório do cache de blobs/trees ('' desativa)")
+    parser.add_argument("--accurate", action="store_true", help="usa lizard para a complexidade ciclomática (mais lento)")
+    parser.add_argument("--mining_processes", type=int, default=defaults.mining_processes, help="minera repos em N processos em vez de threads (0 = threads)")
     args = parser.parse_args()
+    cfg = PipelineConfig.from_args(args, token=GITHUB_TOKEN)
+    blob_cache.configure(cfg.cache_dir)
+    if cfg.accurate:
+        set_accurate_cc(True)
 
-    session = make_session(GITHUB_TOKEN)
+    # uma única session (com o header de auth já montado) para todos os estágios
+    session = make_session(cfg.token)
 
     if args.stage in ("deps","all"):
         print("Running stage: deps", flush=True)
-        stage_deps(limit=args.limit, workers=args.workers, out_json=args.deps_out, session=session)
+        stage_deps(cfg, session)
 
     if args.stage in ("mining","all"):
         print("Running stage: mining (aggregated)", flush=True)
-        sample = None if (args.mining_sample==0) else args.mining_sample
-        stage_mining_aggregate(args.deps_out, sample=sample, workers=args.mining_workers, include_pkg_snapshots=False, out_json=args.mining_json_out, out_csv=args.mining_csv_out, session=session, max_candidates=args.max_candidates, days_back=args.days_back, chunk_size=args.chunk_size, file_limit=args.file_limit)
+        stage_mining_aggregate(cfg, session)
 
     if args.stage in ("merge","all"):
-        commits_input = [args.mining_json_out] if os.path.exists(args.mining_json_out) else []
-        merge_and_plot_main(args.deps_out, commits_input, None, args.final_out, args.plots)
-        print(f"Merge done -> {args.final_out} and plots at {args.plots}", flush=True)
+        stage_merge(cfg)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()